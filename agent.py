@@ -6,7 +6,8 @@ Email agent using ClaudeAgentOptions + query().
 MCP servers are defined in .claude/settings.json — nothing is hardcoded here.
 To add a new tool: deploy an HTTP MCP server and add it to settings.json.
 
-Flow: run_agent(prompt)
+Flow: run_agent(prompt)            # buffers stream_agent() into one dict
+        → stream_agent(prompt)     # yields delta/text/tool/result events
         → load mcp_servers from .claude/settings.json
         → ClaudeAgentOptions(mcp_servers=...)   # passed as --mcp-config to CLI
         → query()
@@ -14,38 +15,70 @@ Flow: run_agent(prompt)
         → HTTP MCP call to App Runner → AWS SES
 """
 
-import json
+import dataclasses
+import functools
+import hashlib
 import logging
+import os
+import sys
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any, Callable, Coroutine, Dict, List, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
 
+import orjson
 from dotenv import load_dotenv
 
-load_dotenv()
-
-from claude_agent_sdk import (
-    query,
-    ClaudeAgentOptions,
-    AssistantMessage,
-    TextBlock,
-    ThinkingBlock,
-    ToolUseBlock,
-    ToolResultBlock,
-    ResultMessage,
-)
+# claude_agent_sdk is imported on first use rather than at module load, so
+# importing this module (e.g. FastAPI startup, health probes) stays cheap.
+if TYPE_CHECKING:
+    from claude_agent_sdk import (
+        AssistantMessage,
+        ClaudeAgentOptions,
+        ResultMessage,
+        StreamEvent,
+        TextBlock,
+        ThinkingBlock,
+        ToolUseBlock,
+        ToolResultBlock,
+    )
 
 logger = logging.getLogger("AGENT")
 
 project_root = str(Path(__file__).parent)
+# Plain str paths, like project_root: passed straight to os.stat/open/load_dotenv
+_SETTINGS_PATH = os.path.join(project_root, ".claude", "settings.json")
+_ENV_PATH = os.path.join(project_root, ".env")
 
 SYSTEM_PROMPT = "You are a helpful AI assistant with access to various tools. Use them when needed to fulfil the user's request."
 
 
+_env_loaded = False
+
+
+def load_env() -> None:
+    """Load the project-root .env once per process (explicit path, no directory walk)."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv(_ENV_PATH, override=False)
+        _env_loaded = True
+
+
 def _load_settings() -> dict:
     """Load .claude/settings.json from the project root."""
-    settings_path = Path(project_root) / ".claude" / "settings.json"
-    with settings_path.open(encoding="utf-8") as f:
-        return json.load(f)
+    with open(_SETTINGS_PATH, "rb") as f:
+        return orjson.loads(f.read())
 
 
 def _mcp_servers(settings: dict) -> dict:
@@ -61,53 +94,302 @@ def _allowed_tools(settings: dict) -> List[str]:
     return [f"mcp__{name}__*" for name in settings.get("mcpServers", {})]
 
 
-async def run_agent(
-    prompt: str,
-    max_turns: int = 10,
-    callback: Optional[Callable[[str, str], Coroutine]] = None,
-) -> Dict[str, Any]:
-    settings = _load_settings()
+# (settings.json mtime_ns, mcp_servers, allowed_tools) from the last load
+_SETTINGS_CACHE: Optional[Tuple[int, dict, List[str]]] = None
+
+
+def _mcp_config() -> Tuple[int, dict, List[str]]:
+    """Return (mtime_ns, mcp_servers, allowed_tools), re-reading settings.json only when it changes."""
+    global _SETTINGS_CACHE
+    mtime = os.stat(_SETTINGS_PATH).st_mtime_ns
+    if _SETTINGS_CACHE is None or _SETTINGS_CACHE[0] != mtime:
+        settings = _load_settings()
+        _SETTINGS_CACHE = (mtime, _mcp_servers(settings), _allowed_tools(settings))
+    return _SETTINGS_CACHE
+
+
+# ── Message / block handlers ──────────────────────────────────────────────────
+# Keyed by exact message or block type so the loop dispatches with one dict
+# lookup instead of walking an isinstance chain for every item. Each handler
+# logs and returns the events (plain dicts) that stream_agent yields.
+
+_NO_EVENTS: Tuple[Dict[str, Any], ...] = ()
+
+
+def _on_stream_event(message: "StreamEvent") -> Iterable[Dict[str, Any]]:
+    event = message.event
+    if event.get("type") == "content_block_delta":
+        delta = event.get("delta", {})
+        if delta.get("type") == "text_delta":
+            return ({"type": "delta", "text": delta["text"]},)
+    return _NO_EVENTS
+
+
+def _on_assistant(message: "AssistantMessage") -> Iterable[Dict[str, Any]]:
+    handlers = _handlers()
+    events: List[Dict[str, Any]] = []
+    for block in message.content:
+        handler = handlers.get(type(block))
+        if handler:
+            events.extend(handler(block))
+    return events
+
 
-    options = ClaudeAgentOptions(
+def _on_result(message: "ResultMessage") -> Iterable[Dict[str, Any]]:
+    cost  = message.total_cost_usd or 0.0
+    usage = message.usage or {}
+    # The CLI marks the system prompt and tool list with cache_control;
+    # cache_read > 0 confirms the static prefix was served from cache.
+    logger.info(
+        "[AGENT] Done — turns=%d, cost=$%.4f, cache_read=%s, cache_write=%s",
+        message.num_turns, cost,
+        usage.get("cache_read_input_tokens", 0),
+        usage.get("cache_creation_input_tokens", 0),
+    )
+    return ({"type": "result", "turns": message.num_turns, "cost_usd": cost, "is_error": message.is_error},)
+
+
+def _on_text(block: "TextBlock") -> Iterable[Dict[str, Any]]:
+    logger.info("[AGENT] Text: %.100s", block.text)
+    return ({"type": "text", "text": block.text},)
+
+
+def _on_thinking(block: "ThinkingBlock") -> Iterable[Dict[str, Any]]:
+    logger.info("[AGENT] Thinking: %.80s", block.thinking)
+    return _NO_EVENTS
+
+
+def _on_tool_use(block: "ToolUseBlock") -> Iterable[Dict[str, Any]]:
+    logger.info("[AGENT] Tool call: %s | %.200s", block.name, block.input)
+    # Interned so repeated calls to the same tool share one str in tools_used.
+    return ({"type": "tool", "name": sys.intern(block.name), "input": block.input},)
+
+
+def _on_tool_result(block: "ToolResultBlock") -> Iterable[Dict[str, Any]]:
+    logger.info("[AGENT] Tool result: %.200s", block.content)
+    return _NO_EVENTS
+
+
+@functools.lru_cache(maxsize=None)
+def _handlers() -> Dict[type, Callable[[Any], Iterable[Dict[str, Any]]]]:
+    """Build the message/block-type → handler table once, importing the SDK types."""
+    from claude_agent_sdk import (
+        AssistantMessage,
+        ResultMessage,
+        StreamEvent,
+        TextBlock,
+        ThinkingBlock,
+        ToolUseBlock,
+        ToolResultBlock,
+    )
+
+    return {
+        StreamEvent:      _on_stream_event,
+        AssistantMessage: _on_assistant,
+        ResultMessage:    _on_result,
+        TextBlock:        _on_text,
+        ThinkingBlock:    _on_thinking,
+        ToolUseBlock:     _on_tool_use,
+        ToolResultBlock:  _on_tool_result,
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _base_options() -> "ClaudeAgentOptions":
+    """Options shared by every run; stream_agent fills in the per-call fields."""
+    from claude_agent_sdk import ClaudeAgentOptions
+
+    return ClaudeAgentOptions(
         cwd=project_root,
-        mcp_servers=_mcp_servers(settings),    # HTTP MCP servers from settings.json
-        allowed_tools=_allowed_tools(settings),
         permission_mode="bypassPermissions",
         system_prompt=SYSTEM_PROMPT,
-        max_turns=max_turns,
-        max_thinking_tokens=10000,
         # SDK auto-discovers the bundled claude.exe (no cli_path needed).
         # Clear CLAUDECODE so the subprocess doesn't detect a nested session.
         env={"CLAUDECODE": ""},
     )
 
-    response_text = ""
-    tools_used: List[str] = []
-    turns = 0
-    cost  = 0.0
 
-    logger.info(f"[AGENT] Query: {prompt[:120]}")
+async def stream_agent(
+    prompt: str,
+    max_turns: int = 10,
+    max_thinking_tokens: int = 10000,
+    partial: bool = False,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Run the agent on a prompt and yield events as they arrive.
+
+    Event types:
+      delta  → {"text"}              partial text (only when partial=True)
+      text   → {"text"}              a complete text block
+      tool   → {"name", "input"}     a tool call issued by the model
+      result → {"turns", "cost_usd", "is_error"} final run stats
+
+    max_thinking_tokens caps extended thinking per turn; lower it for simple
+    tool-dispatch prompts to cut per-turn latency and cost.
+    """
+    from claude_agent_sdk import query
+
+    load_env()
+    _, mcp_servers, allowed_tools = _mcp_config()
+
+    options = dataclasses.replace(
+        _base_options(),
+        mcp_servers=mcp_servers,    # HTTP MCP servers from settings.json
+        allowed_tools=allowed_tools,
+        max_turns=max_turns,
+        max_thinking_tokens=max_thinking_tokens,
+        include_partial_messages=partial,
+    )
+
+    handlers = _handlers()
+
+    logger.info("[AGENT] Query: %.120s", prompt)
 
     async for message in query(prompt=prompt, options=options):
+        handler = handlers.get(type(message))
+        if handler:
+            for event in handler(message):
+                yield event
+
+
+# ── run_agent ─────────────────────────────────────────────────────────────────
+
+class _RunState:
+    """Mutable per-run accumulator that run_agent folds stream events into."""
+
+    __slots__ = ("text", "tools_used", "turns", "cost", "is_error", "callback", "on_delta")
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[str, str], Coroutine]],
+        on_delta: Optional[Callable[[str], Coroutine]],
+    ):
+        self.text: List[str] = []
+        self.tools_used: List[str] = []
+        self.turns = 0
+        self.cost  = 0.0
+        self.is_error = False
+        self.callback = callback
+        self.on_delta = on_delta
+
+
+# Keyed by event type; a collector may return a coroutine for run_agent to await.
+
+def _collect_delta(event: Dict[str, Any], state: _RunState) -> Optional[Coroutine]:
+    return state.on_delta(event["text"]) if state.on_delta else None
+
+
+def _collect_text(event: Dict[str, Any], state: _RunState) -> Optional[Coroutine]:
+    state.text.append(event["text"])
+    return None
+
+
+def _collect_tool(event: Dict[str, Any], state: _RunState) -> Optional[Coroutine]:
+    state.tools_used.append(event["name"])
+    return state.callback(f"Calling {event['name']}", "⚙️") if state.callback else None
+
+
+def _collect_result(event: Dict[str, Any], state: _RunState) -> Optional[Coroutine]:
+    state.turns = event["turns"]
+    state.cost  = event["cost_usd"]
+    state.is_error = event["is_error"]
+    return None
+
+
+_COLLECTORS: Dict[str, Callable[[Dict[str, Any], _RunState], Optional[Coroutine]]] = {
+    "delta":  _collect_delta,
+    "text":   _collect_text,
+    "tool":   _collect_tool,
+    "result": _collect_result,
+}
+
+
+# ── Response cache ────────────────────────────────────────────────────────────
+# Opt-in (run_agent(use_cache=True)) exact-match cache keyed by prompt hash,
+# run limits and the settings.json mtime, so editing the MCP config drops old
+# answers. Only successful runs that made no tool calls are stored: replaying
+# a tool run would silently skip its side effects (e.g. not sending the email),
+# so those always go to the model. Callers should still only enable it where a
+# tool-free answer is safe to replay — a run that skipped its tool because the
+# MCP server was down looks the same.
+
+_RESPONSE_CACHE_TTL = 300.0    # seconds
+_RESPONSE_CACHE_MAX = 256
+
+# (prompt blake2b digest, max_turns, max_thinking_tokens, settings mtime_ns)
+_CacheKey = Tuple[bytes, int, int, int]
+
+_response_cache: "OrderedDict[_CacheKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+
+def _cache_get(key: _CacheKey) -> Optional[Dict[str, Any]]:
+    entry = _response_cache.get(key)
+    if entry is None:
+        return None
+    stored_at, result = entry
+    if time.monotonic() - stored_at > _RESPONSE_CACHE_TTL:
+        del _response_cache[key]
+        return None
+    _response_cache.move_to_end(key)
+    return {**result, "tools_used": [], "cost_usd": 0.0, "cached": True}
+
+
+def _cache_put(key: _CacheKey, result: Dict[str, Any]) -> None:
+    _response_cache[key] = (time.monotonic(), result)
+    _response_cache.move_to_end(key)
+    while len(_response_cache) > _RESPONSE_CACHE_MAX:
+        _response_cache.popitem(last=False)
+
+
+async def run_agent(
+    prompt: str,
+    max_turns: int = 10,
+    callback: Optional[Callable[[str, str], Coroutine]] = None,
+    on_delta: Optional[Callable[[str], Coroutine]] = None,
+    *,
+    max_thinking_tokens: int = 10000,
+    use_cache: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run the agent on a prompt and return the final response plus run stats.
+
+    Buffers stream_agent's events into one dict. If on_delta is given, partial
+    messages are enabled and each text delta is awaited on it as the model
+    produces it, before the full block arrives.
+    With use_cache=True, identical prompts whose last run succeeded without
+    tools are answered from a short-lived cache (marked "cached": True)
+    without starting the CLI.
+    """
+    cache_key: Optional[_CacheKey] = None
+    if use_cache:
+        digest = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        cache_key = (digest, max_turns, max_thinking_tokens, _mcp_config()[0])
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info("[AGENT] Cache hit: %.120s", prompt)
+            if on_delta:
+                await on_delta(cached["response"])
+            return cached
+
+    state = _RunState(callback, on_delta)
+    events = stream_agent(
+        prompt,
+        max_turns=max_turns,
+        max_thinking_tokens=max_thinking_tokens,
+        partial=on_delta is not None,
+    )
+
+    try:
+        async for event in events:
+            pending = _COLLECTORS[event["type"]](event, state)
+            if pending:
+                await pending
+    except BaseException:
+        await events.aclose()    # stop the CLI query rather than leaving it to GC
+        raise
 
-        if isinstance(message, AssistantMessage):
-            for block in message.content:
-                if isinstance(block, TextBlock):
-                    response_text += block.text
-                    logger.info(f"[AGENT] Text: {block.text[:100]}")
-                elif isinstance(block, ThinkingBlock):
-                    logger.info(f"[AGENT] Thinking: {block.thinking[:80]}")
-                elif isinstance(block, ToolUseBlock):
-                    tools_used.append(block.name)
-                    logger.info(f"[AGENT] Tool call: {block.name} | {block.input}")
-                    if callback:
-                        await callback(f"Calling {block.name}", "⚙️")
-                elif isinstance(block, ToolResultBlock):
-                    logger.info(f"[AGENT] Tool result: {block.content}")
-
-        elif isinstance(message, ResultMessage):
-            turns = message.num_turns
-            cost  = message.total_cost_usd or 0.0
-            logger.info(f"[AGENT] Done — turns={turns}, cost=${cost:.4f}")
-
-    return {"response": response_text, "tools_used": tools_used, "turns": turns, "cost_usd": cost}
+    response_text = "".join(state.text)
+    result = {"response": response_text, "tools_used": state.tools_used, "turns": state.turns, "cost_usd": state.cost}
+    if cache_key is not None and not state.tools_used and not state.is_error:
+        _cache_put(cache_key, dict(result))
+    return result
@@ -1,10 +1,36 @@
-import requests
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+import orjson
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse, Response
+from fastapi.responses import Response
 
 EMAIL_API_URL = "https://bss2gd3mbj.execute-api.us-west-2.amazonaws.com/dev/sendEmailAlert"
 
-app = FastAPI(title="Email MCP Server")
+# Max batch entries in flight at once, so one large JSON-RPC batch can't
+# open an unbounded number of concurrent upstream sends.
+_MAX_BATCH_CONCURRENCY = 8
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled async client for the whole process — keeps the TLS connection
+    # to API Gateway alive between tool calls and never blocks the event loop.
+    # HTTP/2 lets concurrent sends share that connection instead of opening more.
+    app.state.http = httpx.AsyncClient(
+        timeout=30,
+        http2=True,
+        headers={"Content-Type": "application/json"},    # bodies are pre-encoded with orjson
+        limits=httpx.Limits(max_keepalive_connections=20, max_connections=50, keepalive_expiry=60),
+    )
+    yield
+    await app.state.http.aclose()
+
+
+app = FastAPI(title="Email MCP Server", lifespan=lifespan)
+
 
 # -------------------------------------------------------
 # Tool schema
@@ -25,91 +51,176 @@ _TOOL_SCHEMA = {
     }
 }
 
+# initialize / tools/list results never change — serialize them once at import.
+# orjson.Fragment splices the pre-encoded bytes into each reply verbatim, so
+# only the envelope (and its id) is encoded per call, batches included.
+# Fragments only serialize through orjson.dumps — see _rpc_response.
+_INITIALIZE_RESULT = orjson.Fragment(orjson.dumps({
+    "protocolVersion": "2024-11-05",
+    "serverInfo": {"name": "email-mcp-server", "version": "2.0.0"},
+    "capabilities": {"tools": {}}
+}))
+_TOOLS_LIST_RESULT = orjson.Fragment(orjson.dumps({"tools": [_TOOL_SCHEMA]}))
+
+
+# -------------------------------------------------------
+# Tool implementations
+# -------------------------------------------------------
+async def _send_email(http: httpx.AsyncClient, arguments: dict) -> str:
+    payload = {
+        "to_email":   arguments.get("to_email"),
+        "from_email": arguments.get("from_email"),
+        "subject":    arguments.get("subject"),
+        "content":    arguments.get("content"),
+    }
+    if arguments.get("cc"):
+        payload["cc"] = arguments["cc"]
+    resp = await http.post(EMAIL_API_URL, content=orjson.dumps(payload))
+    resp.raise_for_status()
+    cc_note = f", cc: {arguments['cc']}" if arguments.get("cc") else ""
+    return f"Email sent from {arguments.get('from_email')} to {arguments.get('to_email')}{cc_note} — status {resp.status_code}"
+
+
+# Tool name → implementation; tools/call dispatches with a single dict lookup.
+# Each is called as handler(http_client, arguments).
+_TOOL_HANDLERS = {
+    "send_email": _send_email,
+}
+
 
 # -------------------------------------------------------
 # Health check (App Runner probes GET /)
 # -------------------------------------------------------
+_HEALTH_BODY = orjson.dumps({"status": "ok", "service": "email-mcp-server"})
+
+
 @app.get("/")
 async def health():
-    return {"status": "ok", "service": "email-mcp-server"}
+    return Response(_HEALTH_BODY, media_type="application/json")
 
 
 # -------------------------------------------------------
 # MCP JSON-RPC 2.0 handler
 # -------------------------------------------------------
+def _rpc_response(payload) -> Response:
+    # Encoded with orjson here, not left to a response class: replies embed the
+    # orjson.Fragment results above, which stdlib json / jsonable_encoder reject.
+    return Response(orjson.dumps(payload), media_type="application/json")
+
+
 @app.post("/")
 async def mcp_handler(request: Request):
-    body = await request.json()
+    body = orjson.loads(await request.body())
+    http = request.app.state.http    # pooled client owned by the lifespan
+
+    # --- batch: one POST carrying an array of requests ---
+    if isinstance(body, list):
+        if not body:
+            return _rpc_response({
+                "jsonrpc": "2.0",
+                "id": None,
+                "error": {"code": -32600, "message": "Invalid Request: empty batch"}
+            })
+        limit = asyncio.Semaphore(_MAX_BATCH_CONCURRENCY)
+
+        async def bounded(msg):
+            async with limit:
+                return await _handle_rpc_isolated(msg, http)
+
+        results = await asyncio.gather(*(bounded(msg) for msg in body))
+        replies = [r for r in results if r is not None]
+        return _rpc_response(replies) if replies else Response(status_code=204)
+
+    reply = await _handle_rpc_isolated(body, http)
+    return _rpc_response(reply) if reply is not None else Response(status_code=204)
+
+
+async def _handle_rpc_isolated(body, http: httpx.AsyncClient) -> Optional[dict]:
+    """_handle_rpc, but an unexpected failure becomes this entry's own -32603 reply.
+
+    Keeps one bad batch entry from turning the whole POST into a 500 after its
+    siblings may already have sent their emails (a client retry would resend them).
+    """
+    try:
+        return await _handle_rpc(body, http)
+    except Exception as e:
+        return {
+            "jsonrpc": "2.0",
+            "id": body.get("id") if isinstance(body, dict) else None,
+            "error": {"code": -32603, "message": f"Internal error: {str(e)}"}
+        }
+
+
+async def _handle_rpc(body: dict, http: httpx.AsyncClient) -> Optional[dict]:
+    """Handle a single JSON-RPC message; returns None when no reply is due."""
+    if not isinstance(body, dict):
+        return {
+            "jsonrpc": "2.0",
+            "id": None,
+            "error": {"code": -32600, "message": "Invalid Request"}
+        }
+
     method = body.get("method", "")
     params = body.get("params", {})
     request_id = body.get("id")
 
-    # --- initialize ---
-    if method == "initialize":
-        return JSONResponse({
+    if not isinstance(params, dict):
+        return {
             "jsonrpc": "2.0",
             "id": request_id,
-            "result": {
-                "protocolVersion": "2024-11-05",
-                "serverInfo": {"name": "email-mcp-server", "version": "2.0.0"},
-                "capabilities": {"tools": {}}
-            }
-        })
+            "error": {"code": -32602, "message": "Invalid params: expected an object"}
+        }
+
+    # --- initialize ---
+    if method == "initialize":
+        return {"jsonrpc": "2.0", "id": request_id, "result": _INITIALIZE_RESULT}
 
     # --- tools/list ---
     elif method == "tools/list":
-        return JSONResponse({
-            "jsonrpc": "2.0",
-            "id": request_id,
-            "result": {"tools": [_TOOL_SCHEMA]}
-        })
+        return {"jsonrpc": "2.0", "id": request_id, "result": _TOOLS_LIST_RESULT}
 
     # --- tools/call ---
     elif method == "tools/call":
         tool_name = params.get("name")
         arguments = params.get("arguments", {})
+        if not isinstance(arguments, dict):
+            return {
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32602, "message": "Invalid params: arguments must be an object"}
+            }
 
-        if tool_name != "send_email":
-            return JSONResponse({
+        handler = _TOOL_HANDLERS.get(tool_name)
+        if handler is None:
+            return {
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "error": {"code": -32601, "message": f"Tool not found: {tool_name}"}
-            })
+            }
 
         try:
-            payload = {
-                "to_email":   arguments.get("to_email"),
-                "from_email": arguments.get("from_email"),
-                "subject":    arguments.get("subject"),
-                "content":    arguments.get("content"),
-            }
-            if arguments.get("cc"):
-                payload["cc"] = arguments["cc"]
-            resp = requests.post(EMAIL_API_URL, json=payload, timeout=30)
-            resp.raise_for_status()
-            cc_note = f", cc: {arguments['cc']}" if arguments.get("cc") else ""
-            text = f"Email sent from {arguments.get('from_email')} to {arguments.get('to_email')}{cc_note} — status {resp.status_code}"
+            text = await handler(http, arguments)
         except Exception as e:
-            return JSONResponse({
+            return {
                 "jsonrpc": "2.0",
                 "id": request_id,
                 "error": {"code": -32000, "message": f"Email send failed: {str(e)}"}
-            })
+            }
 
-        return JSONResponse({
+        return {
             "jsonrpc": "2.0",
             "id": request_id,
             "result": {"content": [{"type": "text", "text": text}]}
-        })
+        }
 
     # --- notifications (no id) → never respond ---
     elif request_id is None:
-        return Response(status_code=204)
+        return None
 
     # --- unknown method ---
     else:
-        return JSONResponse({
+        return {
             "jsonrpc": "2.0",
             "id": request_id,
             "error": {"code": -32601, "message": f"Method not found: {method}"}
-        })
+        }
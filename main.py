@@ -5,6 +5,7 @@ FastAPI server with REST and WebSocket endpoints.
 
 Start:
     uvicorn main:app --reload --port 8004
+    python main.py                       # same app on the fastest loop/parser; WEB_CONCURRENCY workers
 
 Endpoints:
     GET  /           → service info
@@ -13,19 +14,22 @@ Endpoints:
     WS   /ws         → run agent with real-time streaming
 """
 
-import json
+import asyncio
 import logging
+import os
+import sys
 import time
+from typing import Awaitable, Callable, Tuple
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+import orjson
+from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from pydantic import BaseModel, Field
 
-from agent import run_agent
+from agent import load_env, run_agent
+
+load_env()
 
 logging.basicConfig(
     level=logging.INFO,
@@ -33,22 +37,40 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Opt-in: replay tool-free answers from agent.py's short-lived response cache
+_USE_RESPONSE_CACHE = os.getenv("AGENT_RESPONSE_CACHE", "").lower() in ("1", "true", "yes")
+
 app = FastAPI(title="Email Agent API", version="1.0.0")
 
+# Comma-separated origins, e.g. "https://app.example.com,http://localhost:3000"
+_CORS_ORIGINS = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",") if o.strip()]
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
+    allow_origins=_CORS_ORIGINS,
+    allow_credentials="*" not in _CORS_ORIGINS,    # a wildcard is never combined with credentials
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    max_age=86400,    # browsers cache the preflight for a day instead of re-sending OPTIONS
 )
 
 
 # ── Models ────────────────────────────────────────────────────────────────────
 
+# Extended-thinking budget per turn: the API's minimum up to a cost ceiling
+MIN_THINKING_TOKENS = 1024
+MAX_THINKING_TOKENS = 32000
+
+
 class QueryRequest(BaseModel):
     prompt: str = Field(..., description="What you want the agent to do")
     max_turns: int = Field(default=10, description="Max agent turns")
+    max_thinking_tokens: int = Field(
+        default=10000,
+        ge=MIN_THINKING_TOKENS,
+        le=MAX_THINKING_TOKENS,
+        description="Extended-thinking token budget per turn",
+    )
 
     class Config:
         json_schema_extra = {
@@ -72,54 +94,159 @@ class QueryResponse(BaseModel):
 
 # ── REST Endpoints ────────────────────────────────────────────────────────────
 
+def _json(content: dict) -> Response:
+    """Encode with orjson and return the bytes as-is, skipping FastAPI's response_model pass."""
+    return Response(orjson.dumps(content), media_type="application/json")
+
+
+def _elapsed(start_ns: int) -> float:
+    """Seconds since a perf_counter_ns() start, to 2 decimals via integer math."""
+    return (time.perf_counter_ns() - start_ns) // 10_000_000 / 100
+
+
+# Static bodies, serialized once at import instead of on every request/probe
+_ROOT_BODY = orjson.dumps({
+    "service": "Email Agent API",
+    "version": "1.0.0",
+    "endpoints": ["/query", "/ws", "/status"],
+    "tools": ["mcp__email__send_email"],
+})
+_STATUS_BODY = orjson.dumps({"status": "ok"})
+
+
 @app.get("/")
-def root():
-    return {
-        "service": "Email Agent API",
-        "version": "1.0.0",
-        "endpoints": ["/query", "/ws", "/status"],
-        "tools": ["mcp__email__send_email"],
-    }
+async def root():
+    return Response(_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/status")
-def status():
-    return {"status": "ok"}
+async def status():
+    return Response(_STATUS_BODY, media_type="application/json")
 
 
-@app.post("/query", response_model=QueryResponse)
+@app.post("/query", response_model=QueryResponse)    # documents the shape; _json() bypasses it
 async def query(req: QueryRequest):
     """Run the agent with the given prompt (REST)."""
-    logger.info(f"Prompt: {req.prompt}")
-    start = time.time()
+    logger.info("Prompt: %s", req.prompt)
+    start = time.perf_counter_ns()
 
     try:
-        result = await run_agent(req.prompt, max_turns=req.max_turns)
-        return QueryResponse(
-            success=True,
-            prompt=req.prompt,
-            response=result["response"],
-            tools_used=result["tools_used"],
-            turns=result["turns"],
-            cost_usd=result["cost_usd"],
-            elapsed_seconds=round(time.time() - start, 2),
+        result = await run_agent(
+            req.prompt,
+            max_turns=req.max_turns,
+            max_thinking_tokens=req.max_thinking_tokens,
+            use_cache=_USE_RESPONSE_CACHE,
         )
+        return _json({
+            "success": True,
+            "prompt": req.prompt,
+            "response": result["response"],
+            "tools_used": result["tools_used"],
+            "turns": result["turns"],
+            "cost_usd": result["cost_usd"],
+            "elapsed_seconds": _elapsed(start),
+            "error": None,
+        })
     except Exception as e:
-        logger.error(f"Agent error: {e}")
-        return QueryResponse(
-            success=False,
-            prompt=req.prompt,
-            response="",
-            tools_used=[],
-            turns=0,
-            cost_usd=0.0,
-            elapsed_seconds=round(time.time() - start, 2),
-            error=str(e),
-        )
+        logger.error("Agent error: %s", e)
+        return _json({
+            "success": False,
+            "prompt": req.prompt,
+            "response": "",
+            "tools_used": [],
+            "turns": 0,
+            "cost_usd": 0.0,
+            "elapsed_seconds": _elapsed(start),
+            "error": str(e),
+        })
 
 
 # ── WebSocket Endpoint ────────────────────────────────────────────────────────
 
+async def _send(websocket: WebSocket, event: dict) -> None:
+    """Send one event as a JSON text frame, encoded with orjson rather than stdlib json."""
+    await websocket.send_text(orjson.dumps(event).decode())
+
+
+# Frames buffered per connection before the agent is made to wait for the client
+_OUTBOX_SIZE = 256
+
+
+async def _drain(websocket: WebSocket, outbox: asyncio.Queue) -> None:
+    """Sole writer for the socket — sends queued events in the order they were produced."""
+    while True:
+        await _send(websocket, await outbox.get())
+
+
+def _parse_message(data: str) -> Tuple[str, int, int]:
+    """Return (prompt, max_turns, max_thinking_tokens) from one client message."""
+    # Accept a JSON object { "prompt": "...", "max_turns": 10, "max_thinking_tokens": 10000 };
+    # anything else (plain text, or JSON that isn't an object) is the prompt itself.
+    try:
+        payload = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        payload = None
+    if not isinstance(payload, dict):
+        return data, 10, 10000
+
+    prompt    = payload.get("prompt") or payload.get("query", data)
+    max_turns = payload.get("max_turns", 10)
+
+    # A bad budget falls back to the default without discarding the rest of the message
+    try:
+        thinking_tokens = int(payload.get("max_thinking_tokens", 10000))
+    except (TypeError, ValueError):
+        thinking_tokens = 10000
+    # Same bounds /query enforces through QueryRequest
+    thinking_tokens = min(max(thinking_tokens, MIN_THINKING_TOKENS), MAX_THINKING_TOKENS)
+    return prompt, max_turns, thinking_tokens
+
+
+async def _serve(websocket: WebSocket, send: Callable[[dict], Awaitable[None]]) -> None:
+    """Run one agent query per incoming message until the client disconnects."""
+    async for data in websocket.iter_text():
+        prompt, max_turns, thinking_tokens = _parse_message(data)
+
+        await send({"type": "start", "query": prompt})
+
+        # Callback streams live tool-call events to the WebSocket client
+        async def reasoning_callback(action: str, icon: str = "⚙️"):
+            await send({
+                "type": "reasoning",
+                "message": action,
+                "icon": icon,
+            })
+
+        # Text deltas are forwarded as they arrive; "response" still carries the full text
+        async def delta_callback(text: str):
+            await send({"type": "delta", "text": text})
+
+        start = time.perf_counter_ns()
+
+        try:
+            result = await run_agent(
+                prompt,
+                max_turns=max_turns,
+                callback=reasoning_callback,
+                on_delta=delta_callback,
+                max_thinking_tokens=thinking_tokens,
+                use_cache=_USE_RESPONSE_CACHE,
+            )
+            await send({
+                "type": "response",
+                "response": result["response"],
+                "tools_used": result["tools_used"],
+                "turns": result["turns"],
+                "cost_usd": result["cost_usd"],
+                "elapsed_seconds": _elapsed(start),
+            })
+        except Exception as e:
+            logger.error("[WS] Agent error: %s", e)
+            await send({"type": "error", "message": str(e)})
+        # Not in a finally: once cancelled, awaiting a full outbox would never return
+        await send({"type": "done"})
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """
@@ -128,6 +255,7 @@ async def websocket_endpoint(websocket: WebSocket):
     Message types sent to client:
       start     → query received, processing started
       reasoning → live update from a tool (icon + message)
+      delta     → next chunk of response text, as the model writes it
       response  → final agent response
       done      → processing complete
       error     → something went wrong
@@ -135,46 +263,74 @@ async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     logger.info("[WS] Client connected")
 
+    # Every outgoing frame goes through this bounded queue: the agent only waits
+    # on the socket once _OUTBOX_SIZE frames are backed up, and frames still
+    # reach the client in the order they were produced.
+    outbox: asyncio.Queue = asyncio.Queue(maxsize=_OUTBOX_SIZE)
+    drain = asyncio.create_task(_drain(websocket, outbox))
+    serve = asyncio.create_task(_serve(websocket, outbox.put))
+
+    # Whichever ends first stops the other: a failed send cancels the in-flight
+    # agent run instead of letting it keep spending (or sending email) unseen.
+    # The finally also covers the endpoint itself being cancelled (shutdown), so
+    # neither task — nor a run_agent that could still send email — outlives it.
+    try:
+        await asyncio.wait({drain, serve}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (drain, serve):
+            task.cancel()
+        await asyncio.gather(drain, serve, return_exceptions=True)
+
+    if not drain.cancelled() and drain.exception():
+        logger.warning("[WS] Send failed, run stopped: %r", drain.exception())
+    elif not serve.cancelled() and serve.exception():
+        logger.error("[WS] Connection error: %r", serve.exception())
+    logger.info("[WS] Client disconnected")
+
+
+# ── Entrypoint ────────────────────────────────────────────────────────────────
+
+def _event_loop(workers: int) -> str:
+    """Pick uvicorn's event loop: uvloop if installed, winloop on single-worker Windows."""
+    if sys.platform == "win32":
+        # winloop.install() only affects this process; spawned workers would
+        # get neither it nor a uvicorn-installed loop, so they run on asyncio.
+        if workers > 1:
+            return "asyncio"
+        try:
+            import winloop
+        except ImportError:
+            return "asyncio"
+        winloop.install()
+        return "none"    # policy already installed; uvicorn must not override it
+    try:
+        import uvloop  # noqa: F401
+    except ImportError:
+        return "asyncio"
+    return "uvloop"
+
+
+def _http_parser() -> str:
+    """Pick uvicorn's HTTP parser: the httptools C parser if installed, else h11."""
     try:
-        while True:
-            data = await websocket.receive_text()
-
-            # Accept JSON { "prompt": "...", "max_turns": 10 } or plain text
-            try:
-                payload   = json.loads(data)
-                prompt    = payload.get("prompt") or payload.get("query", data)
-                max_turns = payload.get("max_turns", 10)
-            except json.JSONDecodeError:
-                prompt    = data
-                max_turns = 10
-
-            await websocket.send_json({"type": "start", "query": prompt})
-
-            # Callback streams live tool-call events to the WebSocket client
-            async def reasoning_callback(action: str, icon: str = "⚙️"):
-                await websocket.send_json({
-                    "type": "reasoning",
-                    "message": action,
-                    "icon": icon,
-                })
-
-            start = time.time()
-
-            try:
-                result = await run_agent(prompt, max_turns=max_turns, callback=reasoning_callback)
-                await websocket.send_json({
-                    "type": "response",
-                    "response": result["response"],
-                    "tools_used": result["tools_used"],
-                    "turns": result["turns"],
-                    "cost_usd": result["cost_usd"],
-                    "elapsed_seconds": round(time.time() - start, 2),
-                })
-            except Exception as e:
-                logger.error(f"[WS] Agent error: {e}")
-                await websocket.send_json({"type": "error", "message": str(e)})
-            finally:
-                await websocket.send_json({"type": "done"})
-
-    except WebSocketDisconnect:
-        logger.info("[WS] Client disconnected")
+        import httptools  # noqa: F401
+    except ImportError:
+        return "h11"
+    return "httptools"
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+    # Import string rather than the app object: uvicorn needs it to spawn workers
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8004")),
+        loop=_event_loop(workers),
+        http=_http_parser(),
+        workers=workers,
+        access_log=False,    # /query and /ws already log each request; skip per-probe lines
+    )